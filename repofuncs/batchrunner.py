@@ -0,0 +1,463 @@
+"""
+Headless batch runner for the scheduled footfall and spend refreshes.
+
+Usage:
+    python -m repofuncs.batchrunner refresh.json [--workers 4] [--force]
+
+The config is a JSON file, with paths relative to the config file:
+
+    {
+        "output_dir": "outputs",
+        "workers": 4,
+        "footfall": {
+            "directory": "Footfall Data/Hex Based/Footfall Counts",
+            "prefix": "hex_3hourly_counts",
+            "lookup": "BT Hex ID to Borough Lookup Table.csv",
+            "years": [2023, 2024],
+            "areas": {"london": null, "hf": "Hammersmith and Fulham"},
+            "std": 1,
+            "typical_day": {"start": "2024-09-01", "end": "2024-12-31", "day_night": "day_night"}
+        },
+        "spend": {
+            "directory": "Spend Data/Hex Based/Spend Counts",
+            "prefix": "MRLI_3yr_compressed_adj",
+            "lookup": "mcard_grid_ldn_ref_HS_TC_BID_CAZ_Borough_lookup2.csv",
+            "areas": {"london": null, "hf": "H&F"},
+            "std": 2.5
+        },
+        "cube": {"area": "borough_name", "rename": {"H&F": "Hammersmith and Fulham"}}
+    }
+
+Each area maps to a borough_name, or null for the whole of London. Footfall files are read
+once and split into the configured years by count_date, so a file may hold rows from several years. The optional cube
+section joins spend and footfall on shared areas (see repofuncs.cubefuncs); its lookups
+and overlap weight columns default to the footfall and spend lookups.
+
+Stages form a DAG (ingest -> features -> aggregate -> anomalies -> QoQ/typical day)
+and independent branches run concurrently. A stage is skipped when its outputs are newer than its
+inputs and its parameters and input files (paths, sizes and mtimes) are unchanged since the last run.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+import repofuncs.footfallfuncs as ff
+import repofuncs.spendfuncs as sf
+import repofuncs.cubefuncs as cf
+
+def _stage(name, func, deps=(), inputs=(), outputs=(), **params):
+    return {
+        'name': name, 'func': func, 'deps': list(deps),
+        'inputs': list(inputs), 'outputs': list(outputs), 'params': params
+    }
+
+def _check(df, name):
+    if df is None or df.empty:
+        raise RuntimeError(f'{name} returned no data')
+    return df
+
+def _filter_area(df, borough):
+    if borough:
+        return df[df['borough_name'] == borough]
+    return df
+
+def _ingest_footfall(stage):
+    lookup_path, *files = stage['inputs']
+    data = pd.concat([pd.read_csv(file) for file in files], ignore_index=True)
+    data = pd.merge(
+        data, pd.read_csv(lookup_path),
+        left_on='hex_id', right_on='Hex_ID',
+        how='left'
+    )
+    columns_to_drop = [
+        'Hex_ID','GSS_CODE','day',
+        'loyalty_percentage','dwell_time'
+    ]
+    data = data.drop(columns=[column for column in columns_to_drop if column in data.columns])
+
+    columns_to_fill = [
+        'resident','visitor','worker'
+    ]
+    data[columns_to_fill] = data[columns_to_fill].mask(data[columns_to_fill] < 0).fillna(0).astype('uint16')
+    data['time_indicator'] = data['time_indicator'].str.strip("'")
+    data['count_date'] = pd.to_datetime(data['count_date'])
+    data = data.sort_values(by=['count_date','time_indicator','hex_id'])
+    # Split by the parsed dates rather than file names, as a file's rows can cross a year boundary
+    for year, path in zip(stage['params']['years'], stage['outputs']):
+        year_data = data if year == 'all' else data[data['count_date'].dt.year == int(year)]
+        _check(year_data, f'footfall ingest for {year}').to_pickle(path)
+
+def _footfall_features(stage):
+    data = pd.read_pickle(stage['inputs'][0])
+    data = _check(ff.apply_features(data, time='time_indicator'), 'apply_features')
+    data.to_pickle(stage['outputs'][0])
+
+def _footfall_aggregate(stage):
+    data = _filter_area(pd.read_pickle(stage['inputs'][0]), stage['params']['borough'])
+    agg_data = _check(ff.aggregate_counts(data, agg='sum'), 'aggregate_counts')
+    agg_data.to_pickle(stage['outputs'][0])
+
+def _footfall_anomalies(stage):
+    params = stage['params']
+    agg_data = pd.read_pickle(stage['inputs'][0])
+    footfall_data = _check(ff.correct_anomalies(
+        agg_data, std=params['std'], agg='sum',
+        footfall_type=params['footfall_type'],
+        directory=False
+    ), 'correct_anomalies')
+    footfall_data['corrected_ma_monthly_total'] = footfall_data.groupby(['year'])['corrected_value_total'].transform(lambda x: x.rolling(window=30, min_periods=1).mean().round())
+    footfall_data.to_csv(stage['outputs'][0], index=False)
+
+def _footfall_typical(stage):
+    params = stage['params']
+    data = pd.concat([pd.read_pickle(path) for path in stage['inputs']], ignore_index=True)
+    data = _filter_area(data, params['borough'])
+    typical = ff.typical_footfall(
+        data, params['start'], params['end'],
+        primary_key='hex_id',
+        day_night=params['day_night'],
+        footfall_type=params['footfall_type'],
+        directory=False
+    )
+    for key, path in enumerate(stage['outputs']):
+        _check(typical[key], 'typical_footfall').to_csv(path, index=False)
+
+def _qoq(stage):
+    data = pd.concat([pd.read_csv(path, parse_dates=['count_date']) for path in stage['inputs']], ignore_index=True)
+    quarterly_df = _check(ff.calculate_QoQ_values(data, value=stage['params']['value']), 'calculate_QoQ_values')
+    quarterly_df.to_csv(stage['outputs'][0])
+
+def _ingest_spend(stage):
+    lookup_path, *files = stage['inputs']
+    data = pd.concat([pd.read_csv(file) for file in files], ignore_index=True)
+    data['count_date'] = pd.to_datetime(data['count_date'])
+    data = pd.merge(
+        data, pd.read_csv(lookup_path),
+        on=['ldn_ref','quad_id'],
+        how='left'
+    )
+    columns_to_drop = [
+        'quad_id_no','GSS_CODE','CAZ',
+    ]
+    data = data.drop(columns=[column for column in columns_to_drop if column in data.columns])
+    data = _check(sf.apply_daynight_features(data), 'apply_daynight_features')
+    data = data.sort_values(['count_date','ldn_ref','quad_id'])
+    data.to_pickle(stage['outputs'][0])
+
+def _spend_aggregate(stage):
+    data = _filter_area(pd.read_pickle(stage['inputs'][0]), stage['params']['borough'])
+    spend_data = _check(sf.agg_spend_data(data, day_night=True, std=stage['params']['std']), 'agg_spend_data')
+    spend_data = _check(sf.apply_features(spend_data), 'apply_features')
+    spend_data.to_csv(stage['outputs'][0], index=False)
+
+def _cube(stage):
+    params = stage['params']
+    footfall_lookup, spend_lookup, spend_path, *footfall_paths = stage['inputs']
+    footfall_weights = _check(cf.overlap_weights(
+        pd.read_csv(footfall_lookup).rename(columns={params['footfall_key']: 'hex_id'}),
+        'hex_id', area=params['area'], weight=params['footfall_weight'], rename=params['rename']
+    ), 'overlap_weights')
+    spend_weights = _check(cf.overlap_weights(
+        pd.read_csv(spend_lookup), ['ldn_ref','quad_id'],
+        area=params['area'], weight=params['spend_weight'], rename=params['rename']
+    ), 'overlap_weights')
+    footfall = pd.concat([pd.read_pickle(path) for path in footfall_paths], ignore_index=True)
+    cube = _check(cf.build_cube(
+        footfall, pd.read_pickle(spend_path),
+        footfall_weights, spend_weights, area=params['area']
+    ), 'build_cube')
+    cube.to_pickle(stage['outputs'][0])
+
+def build_stages(config, base_dir='.'):
+    """
+    Builds the list of refresh stages described by a batch config.
+
+    Args:
+        config (dict): Parsed batch config.
+        base_dir (str, optional): Directory that relative config paths are resolved against.
+
+    Returns:
+        list: Stage dictionaries with name, func, deps, inputs, outputs and params.
+    """
+    def resolve(*parts):
+        return os.path.normpath(os.path.join(base_dir, *parts))
+
+    output_dir = resolve(config.get('output_dir', 'outputs'))
+    def output(name):
+        return os.path.join(output_dir, name)
+
+    stages = []
+    footfall = config.get('footfall')
+    if footfall:
+        directory = footfall['directory']
+        prefix = footfall.get('prefix', 'hex_3hourly_counts')
+        lookup = resolve(directory, footfall.get('lookup', 'BT Hex ID to Borough Lookup Table.csv'))
+        areas = footfall.get('areas', {'london': None})
+        footfall_type = footfall.get('footfall_type', ['residents','workers','visitors'])
+        years = footfall.get('years') or ['all']
+
+        files = sorted(glob.glob(resolve(directory, f'{prefix}*.csv')))
+        if not files:
+            raise FileNotFoundError(f'No footfall files match {prefix}*.csv in {resolve(directory)}')
+        stages.append(_stage(
+            'footfall_ingest', _ingest_footfall,
+            inputs=[lookup] + files, outputs=[output(f'footfall_ingest_{year}.pkl') for year in years],
+            years=years
+        ))
+        for year in years:
+            stages.append(_stage(
+                f'footfall_features_{year}', _footfall_features,
+                deps=['footfall_ingest'],
+                inputs=[output(f'footfall_ingest_{year}.pkl')],
+                outputs=[output(f'footfall_features_{year}.pkl')]
+            ))
+            for area, borough in areas.items():
+                stages.append(_stage(
+                    f'footfall_aggregate_{area}_{year}', _footfall_aggregate,
+                    deps=[f'footfall_features_{year}'],
+                    inputs=[output(f'footfall_features_{year}.pkl')],
+                    outputs=[output(f'footfall_aggregate_{area}_{year}.pkl')],
+                    borough=borough
+                ))
+                stages.append(_stage(
+                    f'footfall_anomalies_{area}_{year}', _footfall_anomalies,
+                    deps=[f'footfall_aggregate_{area}_{year}'],
+                    inputs=[output(f'footfall_aggregate_{area}_{year}.pkl')],
+                    outputs=[output(f'footfall_{area}_{year}.csv')],
+                    std=footfall.get('std', 3), footfall_type=footfall_type
+                ))
+
+        typical_day = footfall.get('typical_day')
+        if typical_day:
+            start, end = pd.to_datetime(typical_day['start']), pd.to_datetime(typical_day['end'])
+            window_years = [
+                year for year in years
+                if year == 'all' or start.year <= int(year) <= end.year
+            ]
+            if not window_years:
+                raise ValueError(
+                    f'typical_day {typical_day["start"]} to {typical_day["end"]} covers none of the footfall years {years}'
+                )
+        for area, borough in areas.items():
+            stages.append(_stage(
+                f'footfall_qoq_{area}', _qoq,
+                deps=[f'footfall_anomalies_{area}_{year}' for year in years],
+                inputs=[output(f'footfall_{area}_{year}.csv') for year in years],
+                outputs=[output(f'footfall_qoq_{area}.csv')],
+                value='corrected_value_total'
+            ))
+            if typical_day:
+                stages.append(_stage(
+                    f'footfall_typical_{area}', _footfall_typical,
+                    deps=['footfall_ingest'],
+                    inputs=[output(f'footfall_ingest_{year}.pkl') for year in window_years],
+                    outputs=[
+                        output(f'footfall_typical_{area}.csv'),
+                        output(f'footfall_typical_weekday_{area}.csv'),
+                        output(f'footfall_typical_weekend_{area}.csv')
+                    ],
+                    borough=borough, start=typical_day['start'], end=typical_day['end'],
+                    day_night=typical_day.get('day_night', False), footfall_type=footfall_type
+                ))
+
+    spend = config.get('spend')
+    if spend:
+        directory = spend['directory']
+        prefix = spend.get('prefix', 'MRLI_3yr_compressed_adj')
+        lookup = resolve(directory, spend.get('lookup', 'mcard_grid_ldn_ref_HS_TC_BID_CAZ_Borough_lookup2.csv'))
+        files = sorted(glob.glob(resolve(directory, f'{prefix}*.csv')))
+        if not files:
+            raise FileNotFoundError(f'No spend files match {prefix}*.csv in {resolve(directory)}')
+        stages.append(_stage(
+            'spend_ingest', _ingest_spend,
+            inputs=[lookup] + files, outputs=[output('spend_ingest.pkl')]
+        ))
+        for area, borough in spend.get('areas', {'london': None}).items():
+            stages.append(_stage(
+                f'spend_aggregate_{area}', _spend_aggregate,
+                deps=['spend_ingest'],
+                inputs=[output('spend_ingest.pkl')],
+                outputs=[output(f'spend_{area}.csv')],
+                borough=borough, std=spend.get('std', 2.5)
+            ))
+            stages.append(_stage(
+                f'spend_qoq_{area}', _qoq,
+                deps=[f'spend_aggregate_{area}'],
+                inputs=[output(f'spend_{area}.csv')],
+                outputs=[output(f'spend_qoq_{area}.csv')],
+                value='corrected_value'
+            ))
+    cube = config.get('cube')
+    if cube and footfall and spend:
+        footfall_lookup = resolve(footfall['directory'], cube.get('footfall_lookup', footfall.get('lookup', 'BT Hex ID to Borough Lookup Table.csv')))
+        spend_lookup = resolve(spend['directory'], cube.get('spend_lookup', spend.get('lookup', 'mcard_grid_ldn_ref_HS_TC_BID_CAZ_Borough_lookup2.csv')))
+        years = footfall.get('years') or ['all']
+        stages.append(_stage(
+            'cube', _cube,
+            deps=['spend_ingest', 'footfall_ingest'],
+            inputs=[footfall_lookup, spend_lookup, output('spend_ingest.pkl')] + [output(f'footfall_ingest_{year}.pkl') for year in years],
+            outputs=[output('cube.pkl')],
+            area=cube.get('area', 'borough_name'),
+            footfall_key=cube.get('footfall_key', 'Hex_ID'),
+            footfall_weight=cube.get('footfall_weight', False),
+            spend_weight=cube.get('spend_weight', False),
+            rename=cube.get('rename', {})
+        ))
+    return stages
+
+def _signature(stage):
+    # Input sizes and mtimes are included so added, removed or replaced input files rerun the stage
+    inputs = [
+        [path, os.path.getsize(path), os.path.getmtime(path)] if os.path.exists(path) else [path, None, None]
+        for path in stage['inputs']
+    ]
+    return json.dumps({'params': stage['params'], 'inputs': inputs}, sort_keys=True, default=str)
+
+def _write_state(state, state_path):
+    # Written to a temporary file then renamed, so an interrupted run never leaves a partial state file
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    temp_path = f'{state_path}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(state, file, indent=2, sort_keys=True)
+    os.replace(temp_path, state_path)
+
+def _up_to_date(stage, state):
+    if state.get(stage['name']) != _signature(stage):
+        return False
+    paths = stage['inputs'] + stage['outputs']
+    if not all(os.path.exists(path) for path in paths):
+        return False
+    oldest_output = min(os.path.getmtime(path) for path in stage['outputs'])
+    return all(os.path.getmtime(path) <= oldest_output for path in stage['inputs'])
+
+def _sort_stages(stages):
+    by_name = {stage['name']: stage for stage in stages}
+    ordered, visiting, done = [], set(), set()
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f'Stage dependency cycle at [{name}]')
+        if name not in by_name:
+            raise KeyError(f'Unknown stage dependency: [{name}]')
+        visiting.add(name)
+        for dep in by_name[name]['deps']:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        ordered.append(by_name[name])
+    for stage in stages:
+        visit(stage['name'])
+    return ordered
+
+def _run_stage(stage):
+    start = time.perf_counter()
+    for path in stage['outputs']:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    stage['func'](stage)
+    return time.perf_counter() - start
+
+def run_stages(stages, workers=4, force=False, state_path=None):
+    """
+    Runs refresh stages in dependency order, with independent stages running concurrently.
+
+    Args:
+        stages (list): Stage dictionaries from build_stages.
+        workers (int, optional): Number of stages to run at once. Defaults to 4.
+        force (bool, optional): Whether to rerun stages that are up to date. Defaults to False.
+        state_path (str, optional): JSON file recording the parameters and inputs of completed stages,
+            updated as each stage finishes.
+
+    Returns:
+        dict: Status ('ran', 'skipped', 'failed' or 'blocked') and seconds taken for each stage.
+    """
+    state = {}
+    if state_path and os.path.exists(state_path):
+        with open(state_path) as file:
+            state = json.load(file)
+
+    pending = _sort_stages(stages)
+    results, running = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            waiting = []
+            for stage in pending:
+                statuses = [results.get(dep, {}).get('status') for dep in stage['deps']]
+                if any(status in ('failed', 'blocked') for status in statuses):
+                    results[stage['name']] = {'status': 'blocked', 'seconds': 0.0}
+                elif not all(status in ('ran', 'skipped') for status in statuses):
+                    waiting.append(stage)
+                elif not force and _up_to_date(stage, state):
+                    results[stage['name']] = {'status': 'skipped', 'seconds': 0.0}
+                else:
+                    print(f'Starting stage {stage["name"]}...')
+                    running[pool.submit(_run_stage, stage)] = stage
+            pending = waiting
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage['name']] = {'status': 'ran', 'seconds': future.result()}
+                    state[stage['name']] = _signature(stage)
+                    print(f'Finished stage {stage["name"]}.')
+                except Exception as e:
+                    results[stage['name']] = {'status': 'failed', 'seconds': 0.0, 'error': str(e)}
+                    state.pop(stage['name'], None)
+                    print(f'Error in stage {stage["name"]}: {e}\n')
+                if state_path:
+                    _write_state(state, state_path)
+    return results
+
+def report_timings(results, wall_time=None):
+    """
+    Prints the status and time taken for each stage.
+
+    Args:
+        results (dict): Output of run_stages.
+        wall_time (float, optional): Total elapsed time of the run in seconds.
+
+    Returns:
+        None
+    """
+    width = max([len(name) for name in results] + [5])
+    print(f'\n{"Stage":<{width}}  {"Status":<8}  {"Seconds":>8}')
+    for name, result in results.items():
+        print(f'{name:<{width}}  {result["status"]:<8}  {result["seconds"]:>8.2f}')
+    print(f'\nStage time: {sum(result["seconds"] for result in results.values()):.2f}s')
+    if wall_time is not None:
+        print(f'Wall time: {wall_time:.2f}s')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the footfall and spend refresh from a config file.')
+    parser.add_argument('config', help='Path to the JSON batch config.')
+    parser.add_argument('--workers', type=int, help='Number of stages to run at once.')
+    parser.add_argument('--force', action='store_true', help='Rerun stages even when their outputs are up to date.')
+    args = parser.parse_args(argv)
+
+    with open(args.config) as file:
+        config = json.load(file)
+    base_dir = os.path.dirname(os.path.abspath(args.config))
+    stages = build_stages(config, base_dir)
+    state_path = os.path.join(base_dir, config.get('output_dir', 'outputs'), 'batch_state.json')
+
+    start = time.perf_counter()
+    results = run_stages(
+        stages,
+        workers=args.workers or config.get('workers', 4),
+        force=args.force,
+        state_path=state_path
+    )
+    report_timings(results, time.perf_counter() - start)
+    return 1 if any(result['status'] in ('failed', 'blocked') for result in results.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+
+import repofuncs.footfallfuncs as ff
+
+footfall_measures = ['resident','worker','visitor']
+spend_measures = ['txn_amt','txn_cnt','txn_amt_adj']
+
+def overlap_weights(lookup, source_key, area='borough_name', **kwargs):
+    """
+    Builds the overlap weight table mapping grid cells to shared areas such as wards or boroughs.
+    Each cell's weights sum to one, so weighted sums split a cell's counts across the areas it overlaps.
+
+    Args:
+        lookup (pd.DataFrame): Lookup with one row per cell/area overlap, e.g. an ArcGIS intersect export.
+        source_key (str or list): Cell key column(s), e.g. 'hex_id' or ['ldn_ref','quad_id'].
+        area (str, optional): Area column. Defaults to 'borough_name'.
+        weight (str, optional): Overlap measure column, e.g. 'Shape_Area'. Defaults to an equal split.
+        rename (dict, optional): Mapping applied to area names so both grids share the same keys.
+
+    Returns:
+        pd.DataFrame: Weight table with the cell key, area and weight columns.
+    """
+    try:
+        source_key = [source_key] if isinstance(source_key, str) else list(source_key)
+        weight = kwargs.get('weight', False)
+        weights = lookup[source_key + [area] + ([weight] if weight else [])].dropna(subset=[area]).copy()
+        if kwargs.get('rename', False):
+            weights[area] = weights[area].replace(kwargs.get('rename'))
+        weights['weight'] = weights[weight].astype(float) if weight else 1.0
+        weights = weights.groupby(source_key + [area], observed=True, as_index=False)['weight'].sum()
+        weights['weight'] = weights['weight'] / weights.groupby(source_key, observed=True)['weight'].transform('sum')
+        return weights
+    except Exception as e:
+        print(f'Error building overlap weights: {e}\n')
+        return pd.DataFrame()
+
+def _weighted_area_sums(df, weights, key, area, measures):
+    data = df.groupby(key + ['count_date','day_night'], observed=True, as_index=False)[measures].sum()
+    data = data.merge(weights, on=key, how='inner')
+    data[measures] = data[measures].mul(data['weight'], axis=0)
+    return data.groupby([area,'count_date','day_night'], observed=True)[measures].sum()
+
+def add_ratios(cube):
+    """
+    Adds spend-to-footfall ratio columns to a DataFrame of summed measures.
+
+    Args:
+        cube (pd.DataFrame): DataFrame with resident, worker, visitor and txn_* columns.
+
+    Returns:
+        pd.DataFrame: DataFrame with footfall_total and ratio columns added.
+    """
+    cube['footfall_total'] = cube[footfall_measures].sum(axis=1, min_count=1)
+    ratios = {
+        'spend_per_visitor':('txn_amt','visitor'),
+        'spend_per_footfall':('txn_amt','footfall_total'),
+        'spend_adj_per_footfall':('txn_amt_adj','footfall_total'),
+        'txn_per_footfall':('txn_cnt','footfall_total'),
+        'spend_per_txn':('txn_amt','txn_cnt'),
+    }
+    for ratio, (numerator, denominator) in ratios.items():
+        cube[ratio] = (cube[numerator] / cube[denominator]).replace([np.inf, -np.inf], np.nan)
+    return cube
+
+def build_cube(footfall, spend, footfall_weights, spend_weights, **kwargs):
+    """
+    Joins hex footfall and grid spend on shared (area, count_date, day_night) keys with precomputed ratios.
+
+    Args:
+        footfall (pd.DataFrame): Hex footfall with hex_id, count_date, time and resident/worker/visitor columns.
+        spend (pd.DataFrame): Grid spend with ldn_ref, quad_id, count_date, time and txn_* columns.
+        footfall_weights (pd.DataFrame): overlap_weights output for hex_id.
+        spend_weights (pd.DataFrame): overlap_weights output for ldn_ref/quad_id.
+        area (str, optional): Shared area column. Defaults to 'borough_name'.
+        footfall_time (str, optional): Footfall time column. Defaults to 'time_indicator'.
+        spend_time (str, optional): Spend time column. Defaults to 'hours'.
+
+    Returns:
+        pd.DataFrame: Cube indexed and sorted by (area, count_date, day_night).
+    """
+    print('\nBuilding spend and footfall cube...')
+    try:
+        area = kwargs.get('area', 'borough_name')
+        footfall_time = kwargs.get('footfall_time', 'time_indicator')
+        spend_time = kwargs.get('spend_time', 'hours')
+
+        footfall = footfall[['hex_id','count_date',footfall_time] + footfall_measures].copy()
+        footfall[footfall_time] = footfall[footfall_time].astype(str).str.strip("'")
+        footfall['day_night'] = footfall[footfall_time].map(ff.time_dict)
+        footfall['count_date'] = pd.to_datetime(footfall['count_date'])
+        footfall[footfall_measures] = footfall[footfall_measures].clip(lower=0)
+
+        spend = spend[['ldn_ref','quad_id','count_date',spend_time] + spend_measures].copy()
+        spend['day_night'] = spend[spend_time].map(ff.time_dict)
+        spend['count_date'] = pd.to_datetime(spend['count_date'])
+
+        cube = pd.concat([
+            _weighted_area_sums(footfall, footfall_weights, ['hex_id'], area, footfall_measures),
+            _weighted_area_sums(spend, spend_weights, ['ldn_ref','quad_id'], area, spend_measures)
+        ], axis=1)
+        cube = add_ratios(cube.sort_index())
+        print('Cube built.\n')
+        return cube
+    except Exception as e:
+        print(f'Error building cube: {e}\n')
+        return pd.DataFrame()
+
+def cube_lookup(cube, area, start=None, end=None, **kwargs):
+    """
+    Selects an area and date range from the cube using its sorted index.
+
+    Args:
+        cube (pd.DataFrame): Output of build_cube.
+        area (str or list): Area name(s) to select.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        day_night (str, optional): '6am-6pm' or '6pm-6am' to select one period.
+        totals (bool, optional): Whether to sum the range per area and recompute the ratios. Defaults to False.
+
+    Returns:
+        pd.DataFrame: Matching rows of the cube, or one total row per area.
+    """
+    try:
+        start = pd.to_datetime(start) if start is not None else None
+        end = pd.to_datetime(end) if end is not None else None
+        areas = [area] if isinstance(area, str) else list(area)
+        day_night = kwargs.get('day_night', False)
+        selection = cube.loc[(areas, slice(start, end), day_night if day_night else slice(None)), :]
+        if kwargs.get('totals', False):
+            measures = footfall_measures + spend_measures
+            selection = add_ratios(selection.groupby(level=0, observed=True)[measures].sum(min_count=1))
+        return selection
+    except Exception as e:
+        print(f'Error looking up cube: {e}\n')
+        return pd.DataFrame()
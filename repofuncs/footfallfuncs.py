@@ -1,6 +1,20 @@
+import os
 import pandas as pd
 import numpy as np
-from scipy.stats import zscore
+from scipy.stats import zscore, t as t_dist
+
+time_dict = {
+    '00-03':'6pm-6am',
+    '03-06':'6pm-6am',
+    '06-09':'6am-6pm',
+    '09-12':'6am-6pm',
+    '12-15':'6am-6pm',
+    '15-18':'6am-6pm',
+    '18-21':'6pm-6am',
+    '21-24':'6pm-6am'
+}
+
+csv_directory = r"C:\Users\jf79\OneDrive - Office Shared Service\Documents\H&F Analysis\Python CSV Repositry"
 
 def apply_features(df, date='count_date', **kwargs):
     """
@@ -38,16 +52,6 @@ def apply_features(df, date='count_date', **kwargs):
         time = kwargs.get('time', False)
         if time:
             try:
-                time_dict = {
-                    '00-03':'6pm-6am',
-                    '03-06':'6pm-6am',
-                    '06-09':'6am-6pm',
-                    '09-12':'6am-6pm',
-                    '12-15':'6am-6pm',
-                    '15-18':'6am-6pm',
-                    '18-21':'6pm-6am',
-                    '21-24':'6pm-6am'
-                }
                 df['day_night'] = df[time].map(time_dict)
             except KeyError as e:
                 print(f'Invalid time column: {e}\n')
@@ -96,6 +100,7 @@ def detect_anomalies(df, **kwargs):
         std (float, optional): Z-score threshold for anomaly detection. Defaults to 3.
         day_night (str, optional): Column name for day/night classification.
         primary_key (str, optional): Additional grouping column.
+        directory (str, optional): Directory to export the CSV to, False to skip the export.
 
     Returns:
         pd.DataFrame: DataFrame with anomaly flags and corrected values.
@@ -105,6 +110,7 @@ def detect_anomalies(df, **kwargs):
         used_keys = {
             'footfall_type','day_night',
             'agg','std','primary_key',
+            'directory'
         }
         redundant_kwargs = set(kwargs.keys()) - used_keys
         if redundant_kwargs:
@@ -136,53 +142,36 @@ def detect_anomalies(df, **kwargs):
             anomalies['is_anomaly?'],
             anomalies['moving_average'],anomalies[f'{footfall_type}_{agg}']
         )
-        anomalies.to_csv(f"C:\\Users\\jf79\\OneDrive - Office Shared Service\\Documents\\H&F Analysis\\Python CSV Repositry\\{footfall_type}.csv")
+        directory = kwargs.get('directory', csv_directory)
+        if directory:
+            anomalies.to_csv(os.path.join(directory, f'{footfall_type}.csv'))
         print('Anomalies have been flagged and corrected.\n')
         return anomalies
     except Exception as e:
         print(f'Error detecting anomalies: {e}\n')
         return pd.DataFrame()
 
-def agg_footfall_data(df, **kwargs):
+def aggregate_counts(df, **kwargs):
     """
-    Aggregates footfall counts by specified grouping fields and applies anomaly detection.
+    Aggregates resident, worker and visitor counts by date and the specified grouping fields.
 
     Args:
-        df (pd.DataFrame): Input DataFrame with raw footfall counts.
+        df (pd.DataFrame): Input DataFrame with raw footfall counts and features applied.
         primary_key (str, optional): Column to group by.
         day_night (str, optional): Column for day/night classification.
-        std (float, optional): Z-score threshold for anomaly detection.
-        agg (str, optional): Aggregation method ('sum', 'mean', etc.).
-        footfall_type (list, optional): List of footfall types to aggregate.
-        time_indicator (str, optional): Name of the time indicator column.
+        agg (str, optional): Aggregation method ('sum', 'mean', etc.). Defaults to 'sum'.
 
     Returns:
-        pd.DataFrame: Aggregated and corrected footfall data.
+        pd.DataFrame: Aggregated footfall counts sorted by date.
     """
-    print('\nAggregating footfall data...')
+    print('\nAggregating footfall counts...')
     try:
-        used_keys = {
-            'primary_key','day_night','std',
-            'agg', 'footfall_type','time_indicator'
-        }
-        redundant_kwargs = set(kwargs.keys()) - used_keys
-        if redundant_kwargs:
-            print(f'Redundant kwargs: {redundant_kwargs}')
-            return pd.DataFrame()
-        unused_keys = set(used_keys) - set(kwargs.keys())
-        if unused_keys:
-            print(f'Missing kwargs: {unused_keys}\nThese args will be set to default values')
-        
-        time_indicator = kwargs.get('time_indicator','time_indicator')
-        df = apply_features(df, time=time_indicator)
-
         merge_list = [
             'count_date','day_name','week_name'
         ]
         merge_list = [kwargs.get('day_night')] + merge_list if kwargs.get('day_night',False) else merge_list
         merge_list = [kwargs.get('primary_key')] + merge_list if kwargs.get('primary_key',False) else merge_list
-        new_categories = merge_list + ['corrected_value']
-        
+
         agg = kwargs.get('agg','sum')
         agg_data = df.groupby(merge_list + ['year','month']).agg(
             residents_sum = ('resident',f'{agg}'),
@@ -194,10 +183,42 @@ def agg_footfall_data(df, **kwargs):
             ['count_date'],
             ascending=True
         )
+        print('Footfall counts aggregated.\n')
+        return agg_data
+    except Exception as e:
+        print(f'Error aggregating footfall counts: {e}\n')
+        return pd.DataFrame()
+
+def correct_anomalies(agg_data, **kwargs):
+    """
+    Detects and corrects anomalies for each footfall type and sums the corrected values into a total.
+
+    Args:
+        agg_data (pd.DataFrame): Aggregated footfall counts from aggregate_counts.
+        primary_key (str, optional): Additional grouping column.
+        day_night (str, optional): Column for day/night classification.
+        std (float, optional): Z-score threshold for anomaly detection. Defaults to 3.
+        agg (str, optional): Aggregation method used. Defaults to 'sum'.
+        footfall_type (list, optional): List of footfall types to correct.
+        directory (str, optional): Directory to export the corrected CSVs to, False to skip the export.
+
+    Returns:
+        pd.DataFrame: Corrected footfall data with a corrected_value_total column.
+    """
+    print('\nCorrecting anomalies...')
+    try:
+        merge_list = [
+            'count_date','day_name','week_name'
+        ]
+        merge_list = [kwargs.get('day_night')] + merge_list if kwargs.get('day_night',False) else merge_list
+        merge_list = [kwargs.get('primary_key')] + merge_list if kwargs.get('primary_key',False) else merge_list
+        new_categories = merge_list + ['corrected_value']
 
         default_values = ['residents','workers','visitors']
         footfall_types = kwargs.get('footfall_type', default_values)
         std = kwargs.get('std',3)
+        agg = kwargs.get('agg','sum')
+        directory = kwargs.get('directory', csv_directory)
         corrected_dataframes = {}
         i = 0
         for footfall_type in footfall_types:
@@ -209,7 +230,8 @@ def agg_footfall_data(df, **kwargs):
                 agg_data,footfall_type=footfall_type,
                 std=std,agg=agg,
                 day_night = kwargs.get('day_night', False),
-                primary_key=kwargs.get('primary_key', False)
+                primary_key=kwargs.get('primary_key', False),
+                directory=directory
             )
             if i > len(footfall_types)-1:
                 new_categories = new_categories + ['year','month']
@@ -227,14 +249,71 @@ def agg_footfall_data(df, **kwargs):
             }
         )
         
-        merge_list = ['year','month']
-        merge_list = [kwargs.get('day_night')] + merge_list if kwargs.get('day_night',False) else merge_list
-        merge_list = [kwargs.get('primary_key')] + merge_list if kwargs.get('primary_key',False) else merge_list
         footfall_data['corrected_value_total'] = 0
         for footfall_type in footfall_types:
             footfall_data['corrected_value_total'] = footfall_data['corrected_value_total'] + footfall_data[f'corrected_value_{footfall_type}']
-        footfall_data['corrected_value_total'].fillna(0, inplace=True)
-        footfall_data.to_csv(r"C:\Users\jf79\OneDrive - Office Shared Service\Documents\H&F Analysis\Python CSV Repositry\footfall_data.csv")
+        footfall_data['corrected_value_total'] = footfall_data['corrected_value_total'].fillna(0)
+        if directory:
+            footfall_data.to_csv(os.path.join(directory, 'footfall_data.csv'))
+        
+        print('Anomalies corrected.\n')
+        return footfall_data
+    except Exception as e:
+        print(f'Error correcting anomalies: {e}\n')
+        return pd.DataFrame()
+
+def agg_footfall_data(df, **kwargs):
+    """
+    Aggregates footfall counts by specified grouping fields and applies anomaly detection.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame with raw footfall counts.
+        primary_key (str, optional): Column to group by.
+        day_night (str, optional): Column for day/night classification.
+        std (float, optional): Z-score threshold for anomaly detection.
+        agg (str, optional): Aggregation method ('sum', 'mean', etc.).
+        footfall_type (list, optional): List of footfall types to aggregate.
+        time_indicator (str, optional): Name of the time indicator column.
+        directory (str, optional): Directory to export the corrected CSVs to, False to skip the export.
+
+    Returns:
+        pd.DataFrame: Aggregated and corrected footfall data.
+    """
+    print('\nAggregating footfall data...')
+    try:
+        used_keys = {
+            'primary_key','day_night','std',
+            'agg', 'footfall_type','time_indicator',
+            'directory'
+        }
+        redundant_kwargs = set(kwargs.keys()) - used_keys
+        if redundant_kwargs:
+            print(f'Redundant kwargs: {redundant_kwargs}')
+            return pd.DataFrame()
+        unused_keys = set(used_keys) - set(kwargs.keys())
+        if unused_keys:
+            print(f'Missing kwargs: {unused_keys}\nThese args will be set to default values')
+        
+        time_indicator = kwargs.get('time_indicator','time_indicator')
+        df = apply_features(df, time=time_indicator)
+
+        agg_data = aggregate_counts(
+            df,
+            primary_key=kwargs.get('primary_key', False),
+            day_night=kwargs.get('day_night', False),
+            agg=kwargs.get('agg','sum')
+        )
+        footfall_data = correct_anomalies(
+            agg_data,
+            primary_key=kwargs.get('primary_key', False),
+            day_night=kwargs.get('day_night', False),
+            std=kwargs.get('std',3),
+            agg=kwargs.get('agg','sum'),
+            footfall_type=kwargs.get('footfall_type', ['residents','workers','visitors']),
+            directory=kwargs.get('directory', csv_directory)
+        )
+        if footfall_data.empty:
+            raise ValueError('No corrected footfall data returned')
         
         print('Footfall Data Aggregated.\n')
         return footfall_data
@@ -255,10 +334,18 @@ def typical_footfall(footfall_data, start, end, **kwargs):
         day_night (str, optional): Column for day/night classification.
         agg (str, optional): Aggregation method.
         footfall_type (list, optional): List of footfall types to aggregate.
+        directory (str, optional): Directory to export the corrected CSVs to, False to skip the export.
+        preview (bool or float, optional): Share of days to sample for a fast preview, see preview_typical_footfall.
+            True samples 5% of days.
 
     Returns:
         dict: Dictionary containing DataFrames for typical, weekday, and weekend footfall.
     """
+    preview = kwargs.pop('preview', False)
+    if preview:
+        fraction = 0.05 if preview is True else preview
+        return preview_typical_footfall(footfall_data, start, end, fraction=fraction, **kwargs)
+
     print('Calculating typical daily footfall...\nFor Weedays and Weekends and Weekly averages...\n')
     columns_to_drop = [
         'OID_','Col_ID','Row_ID','Hex_ID',
@@ -280,7 +367,7 @@ def typical_footfall(footfall_data, start, end, **kwargs):
     columns_to_fill = [
         'resident','worker','visitor'
     ]
-    footfall_data.loc[:, columns_to_fill] = footfall_data[columns_to_fill].applymap(lambda x: np.nan if x < 0 else x)
+    footfall_data[columns_to_fill] = footfall_data[columns_to_fill].mask(footfall_data[columns_to_fill] < 0)
     footfall_data[columns_to_fill] = footfall_data[columns_to_fill].fillna(0)
     footfall_data = footfall_data.sort_values(by=['count_date',f'{time_indicator}',f'{primary_key}'])
     
@@ -290,7 +377,8 @@ def typical_footfall(footfall_data, start, end, **kwargs):
         day_night=kwargs.get('day_night',False),
         primary_key=primary_key,
         agg=kwargs.get('agg', 'sum'),
-        footfall_type=kwargs.get('footfall_type',['residents','workers','visitors'])
+        footfall_type=kwargs.get('footfall_type',['residents','workers','visitors']),
+        directory=kwargs.get('directory', csv_directory)
     )
         
     if kwargs.get('day_night', False):
@@ -323,4 +411,257 @@ def typical_footfall(footfall_data, start, end, **kwargs):
         2 : weekend
     }
 
-    return typical_footfall
\ No newline at end of file
+    return typical_footfall
+
+def calculate_QoQ_values(df, value='corrected_value_total'):
+    """
+    Calculates quarterly means with Quarter-over-Quarter and Year-over-Year percentage changes.
+
+    Args:
+        df (pd.DataFrame): DataFrame with a count_date column and daily values.
+        value (str, optional): Column to summarise. Defaults to 'corrected_value_total'.
+
+    Returns:
+        pd.DataFrame: Quarterly DataFrame with QoQ_change and YoY_change columns.
+    """
+    try:
+        df = df.set_index(pd.to_datetime(df['count_date']))
+        quarterly_df = df[[value]].resample('QE').mean()
+        # Calculate Quarter-over-Quarter (QoQ) percentage change
+        quarterly_df['QoQ_change'] = quarterly_df[value].pct_change() * 100
+        # Calculate Year-over-Year (YoY) percentage change, looking back 4 quarters
+        quarterly_df['YoY_change'] = quarterly_df[value].pct_change(periods=4) * 100
+        return quarterly_df.round(2)
+    except Exception as e:
+        print(f'Error calculating QoQ values: {e}\n')
+        return pd.DataFrame()
+
+def _day_night(time):
+    # Maps the few distinct time indicators rather than every row; missing values (code -1) map to NaN
+    codes, slots = pd.factorize(time)
+    day_night = pd.Series(slots.astype(str)).str.strip("'").map(time_dict).tolist() + [np.nan]
+    return pd.Series(np.array(day_night, dtype=object)[codes], index=time.index)
+
+def _sample_dates(dates, fraction, rng):
+    # Stratified by year and day of week, keeping at least two days per stratum for the variance
+    parsed = pd.to_datetime(dates)
+    strata = pd.DataFrame({
+        'count_date': dates, 'year': parsed.year, 'day_of_week': parsed.dayofweek
+    })
+    sampled = []
+    for _, stratum in strata.groupby(['year','day_of_week']):
+        n = min(len(stratum), max(2, int(np.ceil(fraction * len(stratum)))))
+        sampled.append(stratum.iloc[rng.choice(len(stratum), n, replace=False)])
+    population = strata.groupby(['year','day_of_week']).size().rename('population')
+    return pd.concat(sampled)['count_date'], population
+
+def _stratified_means(daily, population, primary_key, columns, confidence):
+    # Combines per day-of-week stratum means into one mean per year and key, weighted by stratum size
+    result = None
+    for column in columns:
+        stats = daily.groupby(['year',primary_key,'day_of_week'])[column].agg(['mean','var','count']).reset_index()
+        stats = stats.merge(population.reset_index(), on=['year','day_of_week'], how='left')
+        stats['weight'] = stats['population'] / stats.groupby(['year',primary_key])['population'].transform('sum')
+        stats['weighted_mean'] = stats['weight'] * stats['mean']
+        stats['variance'] = stats['weight'] ** 2 * stats['var'].fillna(0) * (1 - stats['count'] / stats['population']).clip(lower=0) / stats['count']
+        stats['dof'] = stats['count'] - 1
+        grouped = stats.groupby(['year',primary_key])[['weighted_mean','variance','dof']].sum().reset_index()
+        t_value = t_dist.ppf(1 - (1 - confidence) / 2, grouped['dof'].clip(lower=1))
+        grouped[column] = grouped['weighted_mean']
+        grouped[f'{column}_ci'] = t_value * np.sqrt(grouped['variance'])
+        grouped = grouped[['year',primary_key,column,f'{column}_ci']]
+        result = grouped if result is None else result.merge(grouped, on=['year',primary_key], how='outer')
+    return result
+
+def preview_typical_footfall(footfall_data, start, end, **kwargs):
+    """
+    Estimates typical daily, weekday, and weekend footfall averages from a stratified sample of days.
+    Every hex is kept; days are sampled within each year and day of week, and all time slots of a sampled
+    day are used so day/night splits are complete. Anomalies are not corrected.
+
+    Args:
+        footfall_data (pd.DataFrame): DataFrame containing footfall counts.
+        start (str or datetime): Start date for filtering.
+        end (str or datetime): End date for filtering.
+        fraction (float, optional): Share of days to sample in each stratum. Defaults to 0.05.
+        seed (int, optional): Random seed for the sample. Defaults to 0.
+        confidence (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        primary_key (str, optional): Column to group by. Defaults to 'hex_id'.
+        time_indicator (str, optional): Name of the time indicator column.
+        day_night (str, optional): Column for day/night classification.
+        footfall_type (list, optional): List of footfall types to sum.
+
+    Returns:
+        dict: Dictionary containing DataFrames for typical, weekday, and weekend footfall, with a
+        '_ci' confidence interval half-width column for each mean.
+    """
+    print('Calculating preview typical daily footfall...\n')
+    try:
+        fraction = kwargs.get('fraction', 0.05)
+        confidence = kwargs.get('confidence', 0.95)
+        primary_key = kwargs.get('primary_key', 'hex_id')
+        time_indicator = kwargs.get('time_indicator','time_indicator')
+        day_night = kwargs.get('day_night', False)
+        footfall_types = kwargs.get('footfall_type', ['residents','workers','visitors'])
+        columns_to_sum = [footfall_type[:-1] for footfall_type in footfall_types]
+
+        dates = pd.Series(footfall_data['count_date'].unique())
+        parsed = pd.to_datetime(dates)
+        dates = dates[(parsed >= pd.to_datetime(start)) & (parsed <= pd.to_datetime(end))]
+        sampled_dates, population = _sample_dates(dates.values, fraction, np.random.default_rng(kwargs.get('seed', 0)))
+        print(f'Sampled {len(sampled_dates)} of {len(dates)} days.')
+
+        sample = footfall_data.loc[
+            footfall_data['count_date'].isin(sampled_dates),
+            [primary_key,'count_date',time_indicator] + columns_to_sum
+        ]
+        sample['value'] = sample[columns_to_sum].clip(lower=0).fillna(0).sum(axis=1)
+        merge_list = [primary_key,'count_date']
+        if day_night:
+            sample['day_night'] = _day_night(sample[time_indicator])
+            merge_list = merge_list + ['day_night']
+        daily = sample.groupby(merge_list, observed=True)['value'].sum()
+        if day_night:
+            daily = daily.unstack('day_night').rename(columns={
+                '6am-6pm':'daytime_mean', '6pm-6am':'nighttime_mean'
+            })
+            columns = ['daytime_mean','nighttime_mean']
+        else:
+            daily = daily.to_frame('averages')
+            columns = ['averages']
+        daily = daily.reset_index()
+        daily['count_date'] = pd.to_datetime(daily['count_date'])
+        daily['year'] = daily['count_date'].dt.year
+        daily['day_of_week'] = daily['count_date'].dt.dayofweek
+
+        typical = _stratified_means(daily, population, primary_key, columns, confidence)
+        averages = {}
+        for week_name, is_week_name in [
+            ('Weekday', lambda x: x < 5),
+            ('Weekend', lambda x: x >= 5)
+        ]:
+            averages[week_name] = _stratified_means(
+                daily[is_week_name(daily['day_of_week'])],
+                population[is_week_name(population.index.get_level_values('day_of_week'))],
+                primary_key, columns, confidence
+            )
+            averages[week_name].insert(1, 'week_name', week_name)
+
+        typical_footfall = {
+            0 : typical,
+            1 : averages['Weekday'],
+            2 : averages['Weekend']
+        }
+        return typical_footfall
+    except Exception as e:
+        print(f'Error calculating preview typical footfall: {e}\n')
+        return {}
+
+def preview_footfall_trend(footfall_data, **kwargs):
+    """
+    Estimates daily total footfall from a stratified sample of hexes, for quick trend lines.
+    Hexes are sampled within each stratum (e.g. borough) and scaled up to the stratum size.
+
+    Args:
+        footfall_data (pd.DataFrame): DataFrame containing footfall counts.
+        fraction (float, optional): Share of hexes to sample in each stratum. Defaults to 0.05.
+        seed (int, optional): Random seed for the sample. Defaults to 0.
+        confidence (float, optional): Confidence level of the intervals. Defaults to 0.95.
+        primary_key (str, optional): Column identifying each hex. Defaults to 'hex_id'.
+        strata (str, optional): Column to stratify hexes by. Defaults to 'borough_name' when present.
+        time_indicator (str, optional): Name of the time indicator column.
+        day_night (str, optional): Column for day/night classification.
+        footfall_type (list, optional): List of footfall types to sum.
+
+    Returns:
+        pd.DataFrame: Daily estimates in corrected_value_total with a corrected_value_total_ci half-width column.
+    """
+    print('Calculating preview footfall trend...\n')
+    try:
+        fraction = kwargs.get('fraction', 0.05)
+        confidence = kwargs.get('confidence', 0.95)
+        primary_key = kwargs.get('primary_key', 'hex_id')
+        time_indicator = kwargs.get('time_indicator','time_indicator')
+        day_night = kwargs.get('day_night', False)
+        strata = kwargs.get('strata', 'borough_name' if 'borough_name' in footfall_data.columns else False)
+        footfall_types = kwargs.get('footfall_type', ['residents','workers','visitors'])
+        columns_to_sum = [footfall_type[:-1] for footfall_type in footfall_types]
+        rng = np.random.default_rng(kwargs.get('seed', 0))
+
+        if strata:
+            hexes = footfall_data[[primary_key, strata]].drop_duplicates(primary_key)
+            hexes[strata] = hexes[strata].fillna('Unknown')
+        else:
+            hexes = pd.DataFrame({primary_key: footfall_data[primary_key].unique(), 'stratum': 'All'})
+            strata = 'stratum'
+        sampled = []
+        for _, stratum in hexes.groupby(strata, observed=True):
+            n = min(len(stratum), max(2, int(np.ceil(fraction * len(stratum)))))
+            sampled.append(stratum.iloc[rng.choice(len(stratum), n, replace=False)])
+        sampled = pd.concat(sampled)
+        sizes = pd.DataFrame({
+            'population': hexes.groupby(strata, observed=True).size(),
+            'n': sampled.groupby(strata, observed=True).size()
+        })
+        print(f'Sampled {len(sampled)} of {len(hexes)} hexes.')
+
+        sample = footfall_data.loc[
+            footfall_data[primary_key].isin(sampled[primary_key]),
+            [primary_key,'count_date',time_indicator] + columns_to_sum
+        ]
+        sample = sample.merge(sampled[[primary_key, strata]], on=primary_key, how='left')
+        sample['value'] = sample[columns_to_sum].clip(lower=0).fillna(0).sum(axis=1)
+        merge_list = ['count_date']
+        if day_night:
+            sample['day_night'] = _day_night(sample[time_indicator])
+            merge_list = merge_list + ['day_night']
+
+        # Hexes with no rows on a date count as zero, as they would in the exact sum
+        per_hex = sample.groupby(merge_list + [strata, primary_key], observed=True)['value'].sum().reset_index()
+        per_hex['squared'] = per_hex['value'] ** 2
+        stats = per_hex.groupby(merge_list + [strata], observed=True)[['value','squared']].sum().join(sizes, on=strata)
+        mean = stats['value'] / stats['n']
+        variance = ((stats['squared'] - stats['n'] * mean ** 2) / (stats['n'] - 1)).clip(lower=0)
+        stats['total'] = stats['population'] * mean
+        stats['variance'] = stats['population'] ** 2 * (1 - stats['n'] / stats['population']) * variance / stats['n']
+        stats['dof'] = stats['n'] - 1
+
+        trend = stats.groupby(merge_list, observed=True)[['total','variance','dof']].sum().reset_index()
+        t_value = t_dist.ppf(1 - (1 - confidence) / 2, trend['dof'].clip(lower=1))
+        trend['corrected_value_total'] = trend['total']
+        trend['corrected_value_total_ci'] = t_value * np.sqrt(trend['variance'])
+        trend = apply_features(trend.drop(columns=['total','variance','dof']))
+        return trend.sort_values(merge_list).reset_index(drop=True)
+    except Exception as e:
+        print(f'Error calculating preview footfall trend: {e}\n')
+        return pd.DataFrame()
+
+def preview_error(preview, exact, primary_key='hex_id'):
+    """
+    Compares a preview typical_footfall result with the exact run on the same data.
+
+    Args:
+        preview (dict): Output of preview_typical_footfall.
+        exact (dict): Output of typical_footfall.
+        primary_key (str, optional): Column the results are grouped by. Defaults to 'hex_id'.
+
+    Returns:
+        pd.DataFrame: Mean and maximum relative error, and the share of exact values inside the
+        preview confidence intervals, for each output and column.
+    """
+    names = {0:'typical', 1:'weekday', 2:'weekend'}
+    rows = []
+    for key, name in names.items():
+        merge_list = ['year', primary_key] + (['week_name'] if key else [])
+        merged = pd.merge(exact[key], preview[key], on=merge_list, how='inner', suffixes=['_exact','_preview'])
+        for column in [column for column in exact[key].columns if column not in merge_list]:
+            exact_values = merged[f'{column}_exact']
+            preview_values = merged[f'{column}_preview']
+            relative_error = ((preview_values - exact_values).abs() / exact_values.abs()).replace([np.inf, -np.inf], np.nan)
+            rows.append({
+                'output': name, 'column': column,
+                'mean_relative_error': relative_error.mean(),
+                'max_relative_error': relative_error.max(),
+                'ci_coverage': ((preview_values - exact_values).abs() <= merged[f'{column}_ci']).mean()
+            })
+    return pd.DataFrame(rows)
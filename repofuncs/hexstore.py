@@ -0,0 +1,252 @@
+import os
+import json
+import warnings
+import pandas as pd
+import numpy as np
+
+time_slots = ['00-03','03-06','06-09','09-12','12-15','15-18','18-21','21-24']
+measures = ['resident','worker','visitor']
+
+# Slot positions for 6am-6pm (day) and 6pm-6am (night), matching the day_night mapping in apply_features
+# Keep these as basic slices: slices index the memmap as views, while lists or arrays copy the selected slab
+day_slots = slice(2, 6)
+night_slots = (slice(0, 2), slice(6, 8))
+
+def write_hex_store(df, path, dtype='uint16', **kwargs):
+    """
+    Writes long-format hex footfall to a memory-mapped hex x day x time slot x measure array.
+    A hex x day x time slot presence mask records which rows exist, so absent rows are not read
+    back as zero counts. NaN and negative counts in existing rows are stored as zero, as in typical_footfall.
+
+    Args:
+        df (pd.DataFrame): Hex footfall with hex_id, count_date, time indicator and resident/worker/visitor columns.
+        path (str): Directory to write counts.npy, present.npy and metadata.json to.
+        dtype (str, optional): Storage dtype. Defaults to 'uint16', as used in the footfall notebook.
+        time_indicator (str, optional): Name of the time indicator column. Defaults to 'time_indicator'.
+
+    Returns:
+        dict: The opened store, see open_hex_store.
+    """
+    print('\nWriting hex store...')
+    time_indicator = kwargs.get('time_indicator', 'time_indicator')
+    dates = pd.to_datetime(df['count_date']).values.astype('datetime64[D]')
+    start, end = dates.min(), dates.max()
+    hex_ids, hex_index = np.unique(df['hex_id'].to_numpy(), return_inverse=True)
+    date_index = (dates - start).astype(np.int64)
+    slot_index = pd.Categorical(
+        df[time_indicator].astype(str).str.strip("'"), categories=time_slots
+    ).codes
+    if (slot_index < 0).any():
+        raise KeyError(f'Invalid time indicators: {set(df[time_indicator][slot_index < 0].unique())}')
+    cells = np.ravel_multi_index((hex_index, date_index, slot_index), (len(hex_ids), int(date_index.max()) + 1, len(time_slots)))
+    if len(np.unique(cells)) != len(cells):
+        raise ValueError('Duplicate hex_id, count_date and time indicator rows; aggregate them before writing the store')
+
+    limit = np.iinfo(dtype).max if np.issubdtype(np.dtype(dtype), np.integer) else None
+    values = df[measures].to_numpy(dtype=float)
+    values = np.nan_to_num(values, nan=0.0).clip(0, limit)
+
+    os.makedirs(path, exist_ok=True)
+    shape = (len(hex_ids), int((end - start).astype(np.int64)) + 1, len(time_slots), len(measures))
+    data = np.lib.format.open_memmap(os.path.join(path, 'counts.npy'), mode='w+', dtype=dtype, shape=shape)
+    data[hex_index, date_index, slot_index] = values.astype(dtype)
+    data.flush()
+    present = np.lib.format.open_memmap(os.path.join(path, 'present.npy'), mode='w+', dtype='uint8', shape=shape[:3])
+    present[hex_index, date_index, slot_index] = 1
+    present.flush()
+    del data, present
+
+    metadata = {
+        'hex_ids': hex_ids.tolist(),
+        'start': str(start),
+        'n_days': shape[1],
+        'time_slots': time_slots,
+        'measures': measures,
+        'dtype': str(np.dtype(dtype)),
+    }
+    with open(os.path.join(path, 'metadata.json'), 'w') as file:
+        json.dump(metadata, file)
+    print(f'Hex store written: {shape[0]} hexes x {shape[1]} days.\n')
+    return open_hex_store(path)
+
+def open_hex_store(path, mode='r'):
+    """
+    Opens a hex store written by write_hex_store without loading the counts into memory.
+
+    Args:
+        path (str): Directory containing counts.npy, present.npy and metadata.json.
+        mode (str, optional): Memory-map mode ('r' or 'r+'). Defaults to 'r'.
+
+    Returns:
+        dict: The memory-mapped 'data' array and 'present' mask with their 'hex_ids', 'dates' and 'hex_index' maps.
+    """
+    with open(os.path.join(path, 'metadata.json')) as file:
+        metadata = json.load(file)
+    hex_ids = np.array(metadata['hex_ids'])
+    return {
+        'data': np.load(os.path.join(path, 'counts.npy'), mmap_mode=mode),
+        'present': np.load(os.path.join(path, 'present.npy'), mmap_mode=mode),
+        'hex_ids': hex_ids,
+        'hex_index': {hex_id: i for i, hex_id in enumerate(hex_ids.tolist())},
+        'dates': pd.date_range(metadata['start'], periods=metadata['n_days'], freq='D'),
+        'time_slots': metadata['time_slots'],
+        'measures': metadata['measures'],
+    }
+
+def _date_slice(store, start=None, end=None):
+    dates = store['dates']
+    first = 0 if start is None else dates.searchsorted(pd.to_datetime(start))
+    last = len(dates) if end is None else dates.searchsorted(pd.to_datetime(end), side='right')
+    return slice(first, last)
+
+def _measure_slice(store, measure=None):
+    if measure is None:
+        return slice(None)
+    i = store['measures'].index(measure)
+    return slice(i, i + 1)
+
+def _slot_totals(store, days, slots, measure=None):
+    # Sums the selected slots per hex and day; days with none of those slots present are NaN
+    data = store['data'][:, days, slots, _measure_slice(store, measure)]
+    totals = data.sum(axis=(2, 3), dtype=np.int64).astype(float)
+    totals[~store['present'][:, days, slots].any(axis=2)] = np.nan
+    return totals
+
+def daily_totals(store, start=None, end=None, measure=None):
+    """
+    Sums each hex's counts per day over all time slots and measures (or one measure).
+
+    Args:
+        store (dict): Output of open_hex_store.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        measure (str, optional): 'resident', 'worker' or 'visitor'. Defaults to all three.
+
+    Returns:
+        np.ndarray: hex x day array of totals, NaN for days with no rows.
+    """
+    return _slot_totals(store, _date_slice(store, start, end), slice(None), measure)
+
+def daynight_totals(store, start=None, end=None, measure=None):
+    """
+    Sums each hex's counts per day into 6am-6pm and 6pm-6am totals.
+
+    Args:
+        store (dict): Output of open_hex_store.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        measure (str, optional): 'resident', 'worker' or 'visitor'. Defaults to all three.
+
+    Returns:
+        np.ndarray: hex x day x 2 array, with day totals at [..., 0] and night totals at [..., 1],
+        NaN where none of the period's rows exist.
+    """
+    days = _date_slice(store, start, end)
+    day = _slot_totals(store, days, day_slots, measure)
+    night = [_slot_totals(store, days, slots, measure) for slots in night_slots]
+    # A night total exists when either of its two slot ranges has rows
+    night = np.where(np.isnan(night[0]) & np.isnan(night[1]), np.nan, np.nansum(night, axis=0))
+    return np.stack([day, night], axis=-1)
+
+def hex_zscores(store, start=None, end=None, measure=None):
+    """
+    Calculates z-scores of each hex's daily totals within each year, as used by detect_anomalies.
+    Days with no rows are left out of the mean and standard deviation and return NaN.
+
+    Args:
+        store (dict): Output of open_hex_store.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        measure (str, optional): 'resident', 'worker' or 'visitor'. Defaults to all three.
+
+    Returns:
+        np.ndarray: hex x day array of z-scores.
+    """
+    totals = daily_totals(store, start, end, measure)
+    years = store['dates'][_date_slice(store, start, end)].year
+    zscores = np.full_like(totals, np.nan)
+    for year in np.unique(years):
+        in_year = years == year
+        values = totals[:, in_year]
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            zscores[:, in_year] = (values - np.nanmean(values, axis=1, keepdims=True)) / np.nanstd(values, axis=1, keepdims=True)
+    return zscores
+
+def typical_means(store, start=None, end=None, day_night=False):
+    """
+    Calculates typical daily, weekday and weekend means per hex, in the same structure as typical_footfall.
+    Means are taken over the days each hex has rows for. Anomalies are not corrected, so use
+    typical_footfall where corrected values are needed.
+
+    Args:
+        store (dict): Output of open_hex_store.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        day_night (bool, optional): Whether to split the means into daytime and nighttime.
+
+    Returns:
+        dict: Dictionary containing DataFrames for typical, weekday, and weekend footfall.
+    """
+    dates = store['dates'][_date_slice(store, start, end)]
+    if day_night:
+        totals = daynight_totals(store, start, end)
+        columns = ['daytime_mean','nighttime_mean']
+    else:
+        totals = daily_totals(store, start, end)[:, :, np.newaxis]
+        columns = ['averages']
+
+    typical, weekday, weekend = [], [], []
+    for year in np.unique(dates.year):
+        for frames, mask, week_name in [
+            (typical, dates.year == year, None),
+            (weekday, (dates.year == year) & (dates.dayofweek < 5), 'Weekday'),
+            (weekend, (dates.year == year) & (dates.dayofweek >= 5), 'Weekend'),
+        ]:
+            if not mask.any():
+                continue
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                means = np.nanmean(totals[:, mask], axis=1)
+            frame = pd.DataFrame(means, columns=columns)
+            frame.insert(0, 'hex_id', store['hex_ids'])
+            if week_name:
+                frame.insert(0, 'week_name', week_name)
+            frame.insert(0, 'year', year)
+            # Hexes with no rows in the period are absent from typical_footfall too
+            frames.append(frame.dropna(subset=columns, how='all'))
+
+    typical_footfall = {
+        0 : pd.concat(typical, ignore_index=True),
+        1 : pd.concat(weekday, ignore_index=True),
+        2 : pd.concat(weekend, ignore_index=True)
+    }
+    return typical_footfall
+
+def hex_store_to_frame(store, start=None, end=None, hexes=None):
+    """
+    Converts a hex store back to long-format footfall rows, sorted like the footfall notebook.
+    Only rows present in the original data are returned.
+
+    Args:
+        store (dict): Output of open_hex_store.
+        start (str or datetime, optional): First date to include.
+        end (str or datetime, optional): Last date to include.
+        hexes (list, optional): hex_ids to include. Defaults to every hex.
+
+    Returns:
+        pd.DataFrame: DataFrame with count_date, time_indicator, hex_id and resident/worker/visitor columns.
+    """
+    days = _date_slice(store, start, end)
+    rows = slice(None) if hexes is None else [store['hex_index'][hex_id] for hex_id in hexes]
+    hex_ids = store['hex_ids'][rows]
+    dates = store['dates'][days]
+
+    # Reorder to day x slot x hex so rows come out sorted by count_date, time_indicator, hex_id
+    present = store['present'][rows, days].transpose(1, 2, 0).reshape(-1).astype(bool)
+    data = store['data'][rows, days].transpose(1, 2, 0, 3).reshape(-1, len(store['measures']))[present]
+    df = pd.DataFrame(data, columns=store['measures'])
+    df.insert(0, 'hex_id', np.tile(hex_ids, len(dates) * len(store['time_slots']))[present])
+    df.insert(0, 'time_indicator', np.tile(np.repeat(store['time_slots'], len(hex_ids)), len(dates))[present])
+    df.insert(0, 'count_date', np.repeat(dates.values, len(store['time_slots']) * len(hex_ids))[present])
+    return df
@@ -1,108 +1,319 @@
-from matplotlib.pyplot import matplotlib as plt
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.ticker as mtick
+import matplotlib.dates as mdates
+from matplotlib.collections import PolyCollection
+from matplotlib.patches import Patch
 
-def plot_footfall(df, df2=None, year=False, category=False, dual_axis=False):
-    tf = df.copy()
-    if df2 is not None:
-        tf2 = df2.copy()
-    title = f'Comparison of Normalised Footfall (Monthly MA)'
+import repofuncs.footfallfuncs as ff
+
+seasons = {
+    'Winter':('01-01','03-20','lightblue'),
+    'Spring':('03-21','06-20','lightgreen'),
+    'Summer':('06-21','09-22','gold'),
+    'Autumn':('09-23','12-21','orange'),
+    'Christmas':('12-22','12-31','red'),
+}
+
+_series_cache = {}
+_series_cache_size = 32
+
+def prepare_series(df, value='corrected_value_total', **kwargs):
+    """
+    Precomputes the moving-average and normalised series used for plotting, one column per series.
+    Results are cached on a hash of the input columns, so replotting the same data skips the work.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a date and value column.
+        value (str, optional): Column to plot. Defaults to 'corrected_value_total'.
+        date (str, optional): Name of the date column. Defaults to 'count_date'.
+        primary_key (str, optional): Column identifying each series, e.g. 'borough_name'.
+        window (int, optional): Moving average window in days, False to skip. Defaults to 30.
+        normalized (bool, optional): Whether to scale each series by its maximum. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Date-indexed DataFrame with one column per series, copied from the cache.
+    """
+    date = kwargs.get('date', 'count_date')
+    primary_key = kwargs.get('primary_key', False)
+    window = kwargs.get('window', 30)
+    normalized = kwargs.get('normalized', True)
+
+    columns = [date, value] + ([primary_key] if primary_key else [])
+    key = (
+        int(pd.util.hash_pandas_object(df[columns], index=False).sum()),
+        len(df), value, date, primary_key, window, normalized
+    )
+    if key in _series_cache:
+        return _series_cache[key].copy()
+
+    if primary_key:
+        series = df.groupby([date, primary_key], observed=True)[value].sum().unstack(primary_key)
+    else:
+        series = df.groupby(date)[value].sum().to_frame(value)
+    series.index = pd.to_datetime(series.index)
+    series = series.sort_index()
+    if window:
+        series = series.rolling(window=window, min_periods=1).mean()
+    if normalized:
+        series = series / series.max()
+
+    if len(_series_cache) >= _series_cache_size:
+        _series_cache.pop(next(iter(_series_cache)))
+    _series_cache[key] = series
+    return series.copy()
+
+def _lttb_indices(x, y, n_out):
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    indices = np.empty(n_out, dtype=int)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:stop] - y[selected]) -
+            (x[selected] - x[start:stop]) * (avg_y - y[selected])
+        )
+        selected = start + int(area.argmax())
+        indices[i + 1] = selected
+    return indices
+
+def _minmax_indices(y, n_buckets):
+    edges = np.linspace(0, len(y), n_buckets + 1).astype(int)
+    indices = [0, len(y) - 1]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            bucket = y[start:stop]
+            indices += [start + int(bucket.argmin()), start + int(bucket.argmax())]
+    return np.unique(indices)
+
+def downsample_series(x, y, max_points, method='lttb'):
+    """
+    Reduces a series to at most max_points points while keeping its visual shape.
+
+    Args:
+        x (array-like): Sorted x values (dates or numbers).
+        y (array-like): y values.
+        max_points (int): Maximum number of points to keep, None to keep all.
+        method (str, optional): 'lttb' (largest triangle three buckets) or 'minmax'. Defaults to 'lttb'.
+
+    Returns:
+        tuple: Downsampled x and y numpy arrays.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    if max_points is None or len(y) <= max(max_points, 3):
+        return x, y
+
+    max_points = max(max_points, 3)
+    if method == 'lttb':
+        x_num = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+        indices = _lttb_indices(x_num.astype(float), y, max_points)
+    elif method == 'minmax':
+        indices = _minmax_indices(y, (max_points - 2) // 2)
+    else:
+        raise KeyError(f'Invalid downsample method: [{method}]')
+    return x[indices], y[indices]
+
+def add_season_bands(ax, start, end, alpha=0.25):
+    """
+    Draws the season bands between two dates onto an axis as a single collection.
+
+    Args:
+        ax (matplotlib.axes.Axes): Axis with dates on the x-axis.
+        start (str or datetime): First date to cover.
+        end (str or datetime): Last date to cover.
+        alpha (float, optional): Band transparency. Defaults to 0.25.
+
+    Returns:
+        list: Legend handles, one per season.
+    """
+    verts, colours = [], []
+    for year in range(pd.to_datetime(start).year, pd.to_datetime(end).year + 1):
+        for season, (start_md, end_md, colour) in seasons.items():
+            x0 = mdates.date2num(pd.to_datetime(f'{year}-{start_md}'))
+            x1 = mdates.date2num(pd.to_datetime(f'{year}-{end_md}'))
+            verts.append([(x0, 0), (x0, 1), (x1, 1), (x1, 0)])
+            colours.append(colour)
+
+    bands = PolyCollection(
+        verts, facecolors=colours, edgecolors='none', alpha=alpha,
+        transform=ax.get_xaxis_transform(), zorder=0
+    )
+    ax.add_collection(bands, autolim=False)
+    return [Patch(facecolor=colour, alpha=alpha, label=season) for season, (_, _, colour) in seasons.items()]
+
+def plot_series(ax, x, y, max_points=None, method='lttb', **kwargs):
+    """
+    Plots a downsampled line onto an axis, one point per pixel column by default.
+
+    Args:
+        ax (matplotlib.axes.Axes): Axis to draw on.
+        x (array-like): Sorted x values.
+        y (array-like): y values.
+        max_points (int, optional): Maximum points to draw. Defaults to the axis width in pixels.
+        method (str, optional): Downsampling method ('lttb' or 'minmax'). Defaults to 'lttb'.
+        **kwargs: Passed to ax.plot.
+
+    Returns:
+        list: The plotted Line2D objects.
+    """
+    if max_points is None:
+        max_points = int(ax.get_window_extent().width)
+    x, y = downsample_series(x, y, max_points, method=method)
+    return ax.plot(x, y, **kwargs)
+
+def plot_footfall_grid(series, keys=None, **kwargs):
+    """
+    Plots many prepared series as small multiples in one figure at a bounded cost per panel.
+
+    Args:
+        series (pd.DataFrame): Output of prepare_series, one column per series.
+        keys (list, optional): Columns to plot. Defaults to every column.
+        ncols (int, optional): Number of panel columns. Defaults to 4.
+        panel_size (tuple, optional): Width and height of each panel in inches. Defaults to (3, 2).
+        max_points (int, optional): Points drawn per panel. Defaults to the panel width in pixels.
+        method (str, optional): Downsampling method ('lttb' or 'minmax'). Defaults to 'minmax'.
+        season_bands (bool, optional): Whether to draw season bands. Defaults to True.
+        title (str, optional): Figure title.
+
+    Returns:
+        matplotlib.figure.Figure: The small multiples figure.
+    """
+    keys = list(series.columns) if keys is None else list(keys)
+    ncols = min(kwargs.get('ncols', 4), len(keys))
+    nrows = -(-len(keys) // ncols)
+    width, height = kwargs.get('panel_size', (3, 2))
+    method = kwargs.get('method', 'minmax')
+    season_bands = kwargs.get('season_bands', True)
+
+    fig, axes = plt.subplots(
+        nrows, ncols, figsize=(width * ncols, height * nrows),
+        sharex=True, sharey=True, squeeze=False
+    )
+    dates = series.index.values
+    handles = []
+    for ax, key in zip(axes.flat, keys):
+        plot_series(
+            ax, dates, series[key].values,
+            max_points=kwargs.get('max_points'), method=method,
+            color='red', linewidth=1
+        )
+        if season_bands:
+            handles = add_season_bands(ax, series.index.min(), series.index.max())
+        ax.set_title(str(key), fontsize=9)
+        ax.tick_params(labelsize=7)
+    for i, ax in enumerate(axes.flat[len(keys):], start=len(keys)):
+        ax.set_visible(False)
+        if i >= ncols:
+            axes.flat[i - ncols].xaxis.set_tick_params(labelbottom=True)
+
+    locator = mdates.AutoDateLocator(minticks=2, maxticks=6)
+    axes[0, 0].xaxis.set_major_locator(locator)
+    axes[0, 0].xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+    axes[0, 0].set_xlim(series.index.min(), series.index.max())
+    if handles:
+        fig.legend(handles=handles, loc='upper right', fontsize=8)
+    fig.suptitle(kwargs.get('title', 'Normalised Footfall (Monthly MA)'), fontsize=14)
+    fig.tight_layout()
+    plt.show()
+    return fig
+
+def _plot_comparison(df, df2=None, year=False, dual_axis=False, **kwargs):
+    title = kwargs.get('title')
+    frames = [df] if df2 is None else [df, df2]
     if year:
-        tf = tf[tf['year'] == year]
-        if df2 is not None:
-            tf2 = tf2[tf2['year'] == year]
+        frames = [tf[tf['year'] == year] for tf in frames]
         title = f'{title} ({year})'
-    
-    if category == 'normalized':
-        tf['corrected_normalized'] = tf['corrected_ma_monthly_total']/tf['corrected_ma_monthly_total'].max()
-        if df2 is not None:
-            tf2['corrected_normalized'] = tf2['corrected_ma_monthly_total']/tf2['corrected_ma_monthly_total'].max()
+
+    plot_data = [
+        prepare_series(tf, value=kwargs.get('value'), window=False, normalized=kwargs.get('normalized')).iloc[:, 0]
+        for tf in frames
+    ]
 
     if dual_axis:
-        fig, ax1 = plt.subplots(figsize=(10, 7))
-        ax1.plot(
-            tf['count_date'],
-            tf[f'corrected_{category}'],
-            label='Footfall (London)',
-            color='red'
-        )
+        colours = kwargs.get('dual_colours')
+        fig, ax1 = plt.subplots(figsize=kwargs.get('dual_figsize'))
+        axes = [ax1] if df2 is None else [ax1, ax1.twinx()]  # Second series on a secondary y-axis
+        for ax, series, label, ylabel, colour, loc in zip(
+            axes, plot_data, kwargs.get('dual_labels'), kwargs.get('dual_ylabels'), colours, ['upper left', 'upper right']
+        ):
+            plot_series(ax, series.index.values, series.values, label=label, color=colour)
+            ax.set_ylabel(ylabel, color=colour, fontsize=14)
+            ax.tick_params(axis='y', labelcolor=colour, labelsize=12)
+            ax.legend(loc=loc)
         ax1.set_xlabel('Date', fontsize=14)
-        ax1.set_ylabel('Footfall Count (London)', color='blue', fontsize=14)
-        ax1.tick_params(axis='y', color='blue', labelsize=12)
-        ax1.legend(loc='upper left')
-
-        if df2 is not None:
-            ax2 = ax1.twinx()  # Create a secondary y-axis
-            ax2.plot(
-                tf2['count_date'],
-                tf2[f'corrected_{category}'],
-                label='Footfall (H&F)',
-                color='blue'
-            )
-            ax2.set_ylabel('Footfall Count (H&F)', color='red')
-            ax2.tick_params(axis='y', labelcolor='red')
-            ax2.legend(loc='upper right')
-
         plt.title(f'{title}')
         plt.show()
+        return
 
-    if category and dual_axis == False:
-        plt.figure(figsize=(12,7))
+    fig, ax = plt.subplots(figsize=kwargs.get('figsize'))
+    for series, label, colour in zip(plot_data, kwargs.get('labels'), ['red', 'blue']):
+        plot_series(ax, series.index.values, series.values, label=label, color=colour)
 
-        plt.plot(
-            tf['count_date'],
-            tf[f'corrected_{category}'],
-            label = 'Normalised Footfall (London)',
-            color = 'red'
-        )
+    start, end = plot_data[0].index.min(), plot_data[0].index.max()
+    handles, _ = ax.get_legend_handles_labels()
+    handles = handles + add_season_bands(ax, start, end)
+    ax.set_xlabel('Date', fontsize=12)
+    ax.set_ylabel(kwargs.get('ylabel'), fontsize=12)
+    ax.set_title(f'{title}', fontsize=16)
+    ax.legend(handles=handles, fontsize=9)
+    ax.tick_params(axis='both', labelsize=10)
+    ax.set_xlim(left=start, right=end)
+    plt.show()
 
-        if df2 is not None:
-            plt.plot(
-            tf2['count_date'],
-            tf2[f'corrected_{category}'],
-            label = 'Normalised Footfall (H&F)',
-            color = 'blue'
-            )
-        
-        seasons = {
-            'Winter':('01-01','03-20','lightblue'),
-            'Spring':('03-21','06-20','lightgreen'),
-            'Summer':('06-21','09-22','gold'),
-            'Autumn':('09-23','12-21','orange'),
-            'Christmas':('12-22','12-31','red'),
-        }
-        if year:
-            plot_years = year
-            for season, (start_md, end_md, colour) in seasons.items():
-                start = f'{year}-{start_md}'
-                end = f'{year}-{end_md}'
-                plt.axvspan(pd.to_datetime(start), pd.to_datetime(end), color=colour, alpha=0.25, label=season)
-        else:
-            plot_years = range(2022,2025)         
-            for year in plot_years:
-                for season, (start_md, end_md, colour) in seasons.items():
-                    start = f'{year}-{start_md}'
-                    end = f'{year}-{end_md}'
-                    plt.axvspan(pd.to_datetime(start), pd.to_datetime(end), color=colour, alpha=0.25, label=season)
-        
-        handles, labels = plt.gca().get_legend_handles_labels()
-        by_label = dict(zip(labels, handles))
-        plt.xlabel('Date', fontsize=12)
-        plt.ylabel('Normalised Footfall', fontsize=12)
-        plt.title(f'{title}', fontsize=16)
-        plt.legend(
-            by_label.values(),
-            by_label.keys(),
-            fontsize=9
-        )
-        plt.xticks(fontsize=10)
-        plt.yticks(fontsize=10)
-        plt.xlim(
-            right = tf['count_date'].max(),
-            left = tf['count_date'].min()
-        )
-        plt.show()
+def plot_footfall(df, df2=None, year=False, category=False, dual_axis=False):
+    if not category:
+        print('## Please specify a category ##')
+        return
 
+    if category == 'normalized':
+        value, normalized = 'corrected_ma_monthly_total', True
     else:
+        value, normalized = f'corrected_{category}', False
+    _plot_comparison(
+        df, df2, year=year, dual_axis=dual_axis,
+        value=value, normalized=normalized,
+        title='Comparison of Normalised Footfall (Monthly MA)',
+        labels=['Normalised Footfall (London)', 'Normalised Footfall (H&F)'],
+        ylabel='Normalised Footfall', figsize=(12,7),
+        dual_labels=['Footfall (London)', 'Footfall (H&F)'],
+        dual_ylabels=['Footfall Count (London)', 'Footfall Count (H&F)'],
+        dual_colours=['red', 'blue'], dual_figsize=(10, 7)
+    )
+
+def plot_spend(df, df2=None, year=False, category=False, agg='Amount', dual_axis=False):
+    if not category:
         print('## Please specify a category ##')
+        return
+
+    # normalized_amt, normalized_cnt and normalized scale the monthly MA of the amount, count and adjusted amount
+    normalized_values = {
+        'normalized_amt':'corrected_ma_monthly_amt',
+        'normalized_cnt':'corrected_ma_monthly_cnt',
+        'normalized':'corrected_ma_monthly',
+    }
+    if category in normalized_values:
+        value, normalized = normalized_values[category], True
+    else:
+        value, normalized = f'corrected_{category}', False
+    _plot_comparison(
+        df, df2, year=year, dual_axis=dual_axis,
+        value=value, normalized=normalized,
+        title=f'Comparison of Normalised {agg} (Monthly MA)',
+        labels=['Normalised Spend (London)', 'Normalised Spend (H&F)'],
+        ylabel='Normalised Spend', figsize=(14,8),
+        dual_labels=['Spend (London)', 'Spend (H&F)'],
+        dual_ylabels=[f'{agg} (London)', f'{agg} (H&F)'],
+        dual_colours=['blue', 'red'], dual_figsize=(15, 10)
+    )
 
 def plot_daily_footfall(df, df2=None, year=False, day_night=False):
     title = f'Comparison of Daytime and Nightime Footfall'
@@ -196,13 +407,7 @@ def plot_daily_footfall(df, df2=None, year=False, day_night=False):
     plt.show()
     
 def calulcaute_QoQ_values(df):
-    df = df.set_index('count_date')
-    df = df[['corrected_value_total']]
-    quarterly_df = df.resample('Q').mean()
-    # Calculate Quarter-over-Quarter (QoQ) percentage change
-    quarterly_df['QoQ_change'] = quarterly_df['corrected_value_total'].pct_change() * 100
-    # Calculate Year-over-Year (YoY) percentage change, looking back 4 quarters
-    quarterly_df['YoY_change'] = quarterly_df['corrected_value_total'].pct_change(periods=4) * 100
-    quarterly_df = quarterly_df.round(2)
+    from IPython.display import display
+    quarterly_df = ff.calculate_QoQ_values(df)
     display(quarterly_df)
-    return quarterly_df
\ No newline at end of file
+    return quarterly_df
@@ -0,0 +1,172 @@
+import pandas as pd
+import numpy as np
+from scipy.stats import zscore
+
+import repofuncs.footfallfuncs as ff
+
+def apply_daynight_features(df, time='hours'):
+    """
+    Maps the 3-hourly time column of the spend data to day/night classifications, using the footfall time_dict.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a time column.
+        time (str, optional): Name of the time column. Defaults to 'hours'.
+
+    Returns:
+        pd.DataFrame: DataFrame with a day_night column added.
+    """
+    try:
+        df['day_night'] = df[time].map(ff.time_dict)
+        return df
+    except KeyError as e:
+        print(f'Invalid time column: {e}\n')
+        return pd.DataFrame()
+
+def apply_features(df, date='count_date'):
+    """
+    Adds the day name of each date to a DataFrame.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame containing a date column.
+        date (str, optional): Name of the date column. Defaults to 'count_date'.
+
+    Returns:
+        pd.DataFrame: DataFrame with a day_name column added.
+    """
+    dictionary = {
+        '0':'Monday',
+        '1':'Tuesday',
+        '2':'Wednesday',
+        '3':'Thursday',
+        '4':'Friday',
+        '5':'Saturday',
+        '6':'Sunday'
+    }
+    try:
+        df['day_name'] = pd.to_datetime(df[date]).dt.dayofweek
+        df['day_name'] = df['day_name'].astype(str)
+        df['day_name'] = df['day_name'].map(dictionary)
+        return df
+    except Exception as e:
+        print(f'Error applying features: {e}\n')
+        return pd.DataFrame()
+
+def detect_anomalies(df, category, std=3, day_night=False):
+    """
+    Detects anomalies in a spend measure using z-score and corrects them using a moving average.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame with aggregated spend data.
+        category (str): Spend measure to check ('amt', 'cnt' or 'amt_adj').
+        std (float, optional): Z-score threshold for anomaly detection. Defaults to 3.
+        day_night (bool, optional): Whether the data is split by day/night.
+
+    Returns:
+        pd.DataFrame: DataFrame with anomaly flags, corrected values and monthly/weekly moving averages.
+    """
+    try:
+        categories = [
+            'count_date',f'spend_{category}',
+            'zscore','is_anomaly?'
+        ]
+        if day_night:
+            categories = categories + ['day_night']
+        anomalies = df.copy()
+        anomalies['zscore'] = zscore(anomalies[f'spend_{category}'])
+        anomalies['is_anomaly?'] = (anomalies['zscore'] < -std) | (anomalies['zscore'] > std)
+
+        anomalies = anomalies[categories]
+        anomalies['year'] = anomalies['count_date'].dt.year
+        anomalies['moving_average'] = anomalies[f'spend_{category}'].rolling(window=7).mean()
+        anomalies['corrected_value'] = np.where(
+            anomalies['is_anomaly?'],
+            anomalies['moving_average'],
+            anomalies[f'spend_{category}']
+        )
+        anomalies['corrected_ma_monthly'] = anomalies['corrected_value'].rolling(window=30).mean()
+        anomalies['corrected_ma_weekly'] = anomalies['corrected_value'].rolling(window=7).mean()
+        return anomalies
+    except Exception as e:
+        print(f'Error detecting anomalies: {e}\n')
+        return pd.DataFrame()
+
+def agg_spend_data(df, day_night=False, std=2.5):
+    """
+    Aggregates Mastercard spend by date and corrects anomalies in the amount, count and adjusted amount.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame with txn_amt, txn_cnt and txn_amt_adj columns.
+        day_night (bool, optional): Whether to split the aggregation by day/night.
+        std (float, optional): Z-score threshold for anomaly detection. Defaults to 2.5.
+
+    Returns:
+        pd.DataFrame: Aggregated and corrected spend data.
+    """
+    print('\nAggregating spend data...')
+    try:
+        merge_list = ['count_date']
+        new_categories = [
+            'count_date','corrected_ma_monthly',
+            'corrected_ma_weekly','corrected_value'
+        ]
+        if day_night:
+            merge_list = merge_list + ['day_night']
+            new_categories = new_categories + ['day_night']
+        df = df.groupby(merge_list).agg(
+            spend_amt = ('txn_amt','sum'),
+            spend_cnt = ('txn_cnt','sum'),
+            spend_amt_adj = ('txn_amt_adj','sum'),
+            average_spend_amt = ('txn_amt','mean'),
+            average_spend_cnt = ('txn_cnt','mean'),
+            average_spend_amt_adj = ('txn_amt_adj','mean')
+        )
+
+        df = df.reset_index()
+        df = df.sort_values(
+            ['count_date'],
+            ascending=False
+        )
+
+        amt_z = detect_anomalies(df,'amt',std,day_night=day_night)
+        cnt_z = detect_anomalies(df,'cnt',std,day_night=day_night)
+        amt_adj_z = detect_anomalies(df,'amt_adj',std,day_night=day_night)
+
+        amt_merge = amt_z[new_categories]
+        cnt_merge = cnt_z[new_categories]
+        new_categories = new_categories + ['year']
+        amt_adj_merge = amt_adj_z[new_categories]
+
+        merge = pd.merge(
+            amt_merge, cnt_merge,
+            how='left', on=merge_list,
+            suffixes=['_amt','_cnt']
+        ).merge(
+            amt_adj_merge,
+            how='left', on=merge_list
+        )
+        print('Spend Data Aggregated.\n')
+        return merge
+    except Exception as e:
+        print(f'Error aggregating spend data: {e}\n')
+        return pd.DataFrame()
+
+def transform_to_daynight(df):
+    """
+    Pivots the DataFrame to separate day/night values for corrected spend.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame with day_night and corrected_value columns.
+
+    Returns:
+        pd.DataFrame: Pivoted DataFrame with day/night columns.
+    """
+    try:
+        transform = df.pivot_table(
+            index = ['count_date','year','day_name'],
+            columns='day_night',
+            values='corrected_value'
+        ).reset_index()
+        return transform
+    except Exception as e:
+        print(f'Error transforming to daynight: {e}\n')
+        return pd.DataFrame()